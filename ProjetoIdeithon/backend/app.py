@@ -8,6 +8,8 @@ cognitive decline, based on MIT/Harvard research protocols.
 
 import os
 import json
+import time
+import uuid
 import tempfile
 import traceback
 from flask import Flask, request, jsonify
@@ -15,6 +17,12 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 from openai import AzureOpenAI
 from voice_analyzer import VoiceBiomarkerExtractor, CognitiveRiskScorer
+from patient_baseline import PatientBaselineStore
+from normative_index import NormativeIndex
+from quality_governor import QualityGovernor
+from response_encoding import (
+    StaticPayload, parse_fields, wants, project, payload_response, compress_response,
+)
 
 load_dotenv()
 
@@ -35,8 +43,27 @@ UPLOAD_FOLDER = tempfile.mkdtemp()
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["MAX_CONTENT_LENGTH"] = 50 * 1024 * 1024  # 50MB max
 
-extractor = VoiceBiomarkerExtractor(sr=16000)
+extractor = VoiceBiomarkerExtractor(
+    sr=16000,
+    max_duration=float(os.getenv("MAX_ANALYSED_SEC")) if os.getenv("MAX_ANALYSED_SEC") else None,
+)
 scorer = CognitiveRiskScorer()
+baseline_store = PatientBaselineStore(
+    os.getenv("BASELINE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines"))
+)
+NORMATIVE_INDEX_PATH = os.getenv(
+    "NORMATIVE_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "normative_index.npz"),
+)
+normative_index = NormativeIndex.load(NORMATIVE_INDEX_PATH) if os.path.exists(NORMATIVE_INDEX_PATH) else None
+governor = QualityGovernor(
+    standard_depth=int(os.getenv("QUALITY_STANDARD_DEPTH", "2")),
+    fast_depth=int(os.getenv("QUALITY_FAST_DEPTH", "4")),
+    rtf_slo=float(os.getenv("QUALITY_RTF_SLO", "0.3")),
+    state_dir=os.getenv("QUALITY_STATE_DIR") or None,
+)
+# Load tests attribute requests to workers through an X-Worker-Pid header; off by default
+EXPOSE_WORKER_PID = os.getenv("EXPOSE_WORKER_PID", "").lower() in ("1", "true", "yes")
 
 azure_client = AzureOpenAI(
     api_key=os.getenv("OPEN_IA"),
@@ -46,12 +73,70 @@ azure_client = AzureOpenAI(
 DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4o")
 
 ALLOWED_EXTENSIONS = {"wav", "mp3", "ogg", "webm", "m4a", "flac"}
+RESEARCH_REFERENCES = [
+    {
+        "title": "Longitudinal Speech Biomarkers for Automated Alzheimer's Detection (OVBM)",
+        "source": "Frontiers in Computer Science, 2021",
+        "url": "https://www.frontiersin.org/articles/10.3389/fcomp.2021.624694/full",
+    },
+    {
+        "title": "Deep learning-based speech analysis for Alzheimer's disease detection",
+        "source": "Alzheimer's Research & Therapy, 2022",
+        "url": "https://alzres.biomedcentral.com/articles/10.1186/s13195-022-01131-3",
+    },
+    {
+        "title": "Speech based detection of Alzheimer's disease: a survey of AI techniques",
+        "source": "Artificial Intelligence Review, 2024",
+        "url": "https://link.springer.com/article/10.1007/s10462-024-10961-6",
+    },
+    {
+        "title": "Digital voice biomarkers and associations with cognition",
+        "source": "Alzheimer's & Dementia: Diagnosis, 2023",
+        "url": "https://alz-journals.onlinelibrary.wiley.com/doi/10.1002/dad2.12393",
+    },
+    {
+        "title": "eGeMAPS: Extended Geneva Minimalistic Acoustic Parameter Set",
+        "source": "IEEE Transactions on Affective Computing, 2016",
+        "url": "https://ieeexplore.ieee.org/document/7160715",
+    },
+]
+
+DEFAULT_CONTOUR_POINTS = 400
+MAX_CONTOUR_POINTS = 2000
 
 
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+class StageTimer:
+    """Records the wall time between consecutive marks, in milliseconds."""
+
+    def __init__(self):
+        self.timings = {}
+        self._last = time.perf_counter()
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self.timings[stage] = round((now - self._last) * 1000, 1)
+        self._last = now
+
+    def server_timing_header(self) -> str:
+        return ", ".join(f"{stage};dur={ms}" for stage, ms in self.timings.items())
+
+
+def parse_contour_points(value: str) -> int:
+    """`contours` request field: "true"/"1" for the default size, or a point count."""
+    value = (value or "").strip().lower()
+    if value in ("", "0", "false", "no"):
+        return 0
+    if value in ("true", "yes", "1"):
+        return DEFAULT_CONTOUR_POINTS
+    if value.isdigit():
+        return max(50, min(int(value), MAX_CONTOUR_POINTS))
+    return DEFAULT_CONTOUR_POINTS
+
+
 def generate_clinical_narrative(biomarkers: dict, risk_assessment: dict, transcript: str = "") -> str:
     """Use Azure OpenAI to generate a clinical-grade narrative analysis,
     as if written by a Harvard/MIT neurology researcher."""
@@ -145,9 +230,13 @@ def analyze_voice():
         return jsonify({"error": f"File type not allowed. Use: {', '.join(ALLOWED_EXTENSIONS)}"}), 400
 
     try:
-        # Save uploaded file
+        timer = StageTimer()
+        fields = parse_fields(request.form.get("fields") or request.args.get("fields"))
+
+        # Save uploaded file (unique name so concurrent requests do not collide)
         ext = file.filename.rsplit(".", 1)[1].lower()
-        temp_path = os.path.join(app.config["UPLOAD_FOLDER"], f"upload.{ext}")
+        upload_id = uuid.uuid4().hex
+        temp_path = os.path.join(app.config["UPLOAD_FOLDER"], f"upload_{upload_id}.{ext}")
         file.save(temp_path)
 
         # Convert to WAV if needed (for librosa/praat compatibility)
@@ -155,20 +244,53 @@ def analyze_voice():
         if ext != "wav":
             from pydub import AudioSegment
             audio = AudioSegment.from_file(temp_path)
-            wav_path = os.path.join(app.config["UPLOAD_FOLDER"], "upload.wav")
+            wav_path = os.path.join(app.config["UPLOAD_FOLDER"], f"upload_{upload_id}.wav")
             audio.export(wav_path, format="wav")
-
-        # Step 1: Extract biomarkers
-        biomarkers = extractor.extract_all(wav_path)
+        timer.mark("upload")
+
+        # Step 1: Extract biomarkers (plus downsampled contours for charts, if requested)
+        # at the quality tier the current load allows
+        contour_points = parse_contour_points(request.form.get("contours") or request.args.get("contours"))
+        with governor.track(request.form.get("quality") or request.args.get("quality")) as quality:
+            biomarkers = extractor.extract_all(wav_path, contour_points=contour_points, tier=quality["tier"])
+            contours = biomarkers.pop("contours", None)
+            preprocessing = biomarkers.pop("preprocessing", None)
+            quality["audio_seconds"] = preprocessing["analysed_duration_sec"]
+        timer.mark("extract")
 
         # Step 2: Score cognitive risk
         risk_assessment = scorer.score(biomarkers)
 
+        # Step 2b: Compare against the patient's own history at the same quality tier (optional)
+        patient_id = request.form.get("patient_id", "").strip()
+        baseline = None
+        if patient_id:
+            baseline = baseline_store.compare_and_update(patient_id, biomarkers, tier=quality["tier"])
+
+        # Step 2c: Percentiles against the age/sex-matched normative population
+        normative = None
+        if normative_index is not None and wants(fields, "normative"):
+            try:
+                age = float(request.form.get("age", ""))
+            except ValueError:
+                age = None
+            if age is not None and not 0 <= age < 150:
+                age = None
+            normative = normative_index.percentiles(biomarkers, age, request.form.get("sex"))
+        timer.mark("score")
+
         # Step 3: Transcribe (optional, may fail if Whisper not available)
-        transcript = transcribe_audio(wav_path)
+        # Upstream calls are skipped when the projection does not need their output
+        transcript = ""
+        if wants(fields, "transcript") or wants(fields, "narrative"):
+            transcript = transcribe_audio(wav_path)
+        timer.mark("transcribe")
 
         # Step 4: Generate clinical narrative via Azure OpenAI
-        narrative = generate_clinical_narrative(biomarkers, risk_assessment, transcript)
+        narrative = None
+        if wants(fields, "narrative"):
+            narrative = generate_clinical_narrative(biomarkers, risk_assessment, transcript)
+        timer.mark("narrative")
 
         # Step 5: Build response
         response = {
@@ -176,6 +298,12 @@ def analyze_voice():
             "risk_assessment": risk_assessment,
             "narrative": narrative,
             "transcript": transcript,
+            "baseline": baseline,
+            "normative": normative,
+            "contours": contours,
+            "analysis_quality": quality,
+            "preprocessing": preprocessing,
+            "timings_ms": timer.timings,
             "biomarkers": {
                 "voice_quality": {
                     "jitter_percent": round(biomarkers.get("jitter_local", 0) * 100, 3),
@@ -211,33 +339,7 @@ def analyze_voice():
                     "range": round(biomarkers.get("energy_range", 0), 4),
                 },
             },
-            "research_references": [
-                {
-                    "title": "Longitudinal Speech Biomarkers for Automated Alzheimer's Detection (OVBM)",
-                    "source": "Frontiers in Computer Science, 2021",
-                    "url": "https://www.frontiersin.org/articles/10.3389/fcomp.2021.624694/full",
-                },
-                {
-                    "title": "Deep learning-based speech analysis for Alzheimer's disease detection",
-                    "source": "Alzheimer's Research & Therapy, 2022",
-                    "url": "https://alzres.biomedcentral.com/articles/10.1186/s13195-022-01131-3",
-                },
-                {
-                    "title": "Speech based detection of Alzheimer's disease: a survey of AI techniques",
-                    "source": "Artificial Intelligence Review, 2024",
-                    "url": "https://link.springer.com/article/10.1007/s10462-024-10961-6",
-                },
-                {
-                    "title": "Digital voice biomarkers and associations with cognition",
-                    "source": "Alzheimer's & Dementia: Diagnosis, 2023",
-                    "url": "https://alz-journals.onlinelibrary.wiley.com/doi/10.1002/dad2.12393",
-                },
-                {
-                    "title": "eGeMAPS: Extended Geneva Minimalistic Acoustic Parameter Set",
-                    "source": "IEEE Transactions on Affective Computing, 2016",
-                    "url": "https://ieeexplore.ieee.org/document/7160715",
-                },
-            ],
+            "research_references": RESEARCH_REFERENCES,
         }
 
         # Cleanup
@@ -248,74 +350,86 @@ def analyze_voice():
         except Exception:
             pass
 
-        return jsonify(response)
+        result = payload_response(request, project(response, fields))
+        result.headers["Server-Timing"] = timer.server_timing_header()
+        if EXPOSE_WORKER_PID:
+            result.headers["X-Worker-Pid"] = str(os.getpid())
+        return result
 
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
 
 
+BIOMARKER_INFO = StaticPayload({
+    "biomarkers": [
+        {
+            "id": "jitter",
+            "name": "Jitter",
+            "description": "Cycle-to-cycle variation in fundamental frequency (pitch perturbation). Elevated jitter indicates irregular vocal fold vibration.",
+            "unit": "%",
+            "healthy_range": "< 1.5%",
+            "ad_indicator": "Increased jitter is associated with vocal instability seen in early cognitive decline.",
+            "research": "Alzheimer's Research & Therapy, 2022",
+        },
+        {
+            "id": "shimmer",
+            "name": "Shimmer",
+            "description": "Cycle-to-cycle variation in amplitude. Measures voice steadiness.",
+            "unit": "%",
+            "healthy_range": "< 6%",
+            "ad_indicator": "Elevated shimmer reflects reduced neuromuscular control of the larynx.",
+            "research": "eGeMAPS Standard (Eyben et al., 2016)",
+        },
+        {
+            "id": "hnr",
+            "name": "Harmonic-to-Noise Ratio (HNR)",
+            "description": "Ratio of harmonic to noise components in voice. Measures breathiness.",
+            "unit": "dB",
+            "healthy_range": "> 10 dB",
+            "ad_indicator": "Lower HNR indicates breathier voice quality, common in neurodegenerative conditions.",
+            "research": "MDPI Applied Sciences, 2023",
+        },
+        {
+            "id": "f0",
+            "name": "Fundamental Frequency (F0)",
+            "description": "The base pitch of the voice. F0 variability reflects emotional and cognitive engagement.",
+            "unit": "Hz",
+            "healthy_range": "Varies by age/gender",
+            "ad_indicator": "Reduced F0 variability (monotone speech) is a key Alzheimer's biomarker.",
+            "research": "Frontiers in Psychology, 2021",
+        },
+        {
+            "id": "pauses",
+            "name": "Speech Pauses",
+            "description": "Frequency and duration of silent pauses during speech. Reflects word-finding difficulty.",
+            "unit": "count/duration",
+            "healthy_range": "< 15 pauses/min, avg < 0.8s",
+            "ad_indicator": "Increased pause frequency and duration indicate word retrieval difficulties.",
+            "research": "Frontiers in Computer Science, 2021 (OVBM)",
+        },
+        {
+            "id": "formants",
+            "name": "Formants (F1, F2, F3)",
+            "description": "Resonant frequencies of the vocal tract. Reflect articulatory precision.",
+            "unit": "Hz",
+            "healthy_range": "Varies by vowel/speaker",
+            "ad_indicator": "Reduced formant variability indicates less precise articulation.",
+            "research": "Speech based detection of AD survey, 2024",
+        },
+    ]
+})
+
+
 @app.route("/api/biomarker-info", methods=["GET"])
 def biomarker_info():
     """Returns educational info about each biomarker."""
-    return jsonify({
-        "biomarkers": [
-            {
-                "id": "jitter",
-                "name": "Jitter",
-                "description": "Cycle-to-cycle variation in fundamental frequency (pitch perturbation). Elevated jitter indicates irregular vocal fold vibration.",
-                "unit": "%",
-                "healthy_range": "< 1.5%",
-                "ad_indicator": "Increased jitter is associated with vocal instability seen in early cognitive decline.",
-                "research": "Alzheimer's Research & Therapy, 2022",
-            },
-            {
-                "id": "shimmer",
-                "name": "Shimmer",
-                "description": "Cycle-to-cycle variation in amplitude. Measures voice steadiness.",
-                "unit": "%",
-                "healthy_range": "< 6%",
-                "ad_indicator": "Elevated shimmer reflects reduced neuromuscular control of the larynx.",
-                "research": "eGeMAPS Standard (Eyben et al., 2016)",
-            },
-            {
-                "id": "hnr",
-                "name": "Harmonic-to-Noise Ratio (HNR)",
-                "description": "Ratio of harmonic to noise components in voice. Measures breathiness.",
-                "unit": "dB",
-                "healthy_range": "> 10 dB",
-                "ad_indicator": "Lower HNR indicates breathier voice quality, common in neurodegenerative conditions.",
-                "research": "MDPI Applied Sciences, 2023",
-            },
-            {
-                "id": "f0",
-                "name": "Fundamental Frequency (F0)",
-                "description": "The base pitch of the voice. F0 variability reflects emotional and cognitive engagement.",
-                "unit": "Hz",
-                "healthy_range": "Varies by age/gender",
-                "ad_indicator": "Reduced F0 variability (monotone speech) is a key Alzheimer's biomarker.",
-                "research": "Frontiers in Psychology, 2021",
-            },
-            {
-                "id": "pauses",
-                "name": "Speech Pauses",
-                "description": "Frequency and duration of silent pauses during speech. Reflects word-finding difficulty.",
-                "unit": "count/duration",
-                "healthy_range": "< 15 pauses/min, avg < 0.8s",
-                "ad_indicator": "Increased pause frequency and duration indicate word retrieval difficulties.",
-                "research": "Frontiers in Computer Science, 2021 (OVBM)",
-            },
-            {
-                "id": "formants",
-                "name": "Formants (F1, F2, F3)",
-                "description": "Resonant frequencies of the vocal tract. Reflect articulatory precision.",
-                "unit": "Hz",
-                "healthy_range": "Varies by vowel/speaker",
-                "ad_indicator": "Reduced formant variability indicates less precise articulation.",
-                "research": "Speech based detection of AD survey, 2024",
-            },
-        ]
-    })
+    return BIOMARKER_INFO.respond(request)
+
+
+@app.after_request
+def compress(response):
+    return compress_response(request, response)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+"""
+Fake Azure OpenAI Server for Load Testing
+
+Answers the two upstream calls made by /api/analyze with canned responses:
+- POST .../chat/completions        (clinical narrative)
+- POST .../audio/transcriptions    (Whisper transcript)
+
+Latency and failures are configurable per endpoint so capacity can be measured
+without live upstream calls. Any deployment name and api-version are accepted.
+
+Usage:
+    python fake_openai.py --port 8900 --chat-latency 2.0 --chat-jitter 0.5 \\
+        --whisper-latency 0.8 --error-rate 0.02
+
+Then point the backend at it:
+    URL_OPEN=http://127.0.0.1:8900 OPEN_IA=fake-key python app.py
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+NARRATIVE = (
+    "**Executive Summary** - Synthetic narrative returned by the load-test server. "
+    "Voice quality, fluency, prosody and articulation were reviewed against research norms.\n\n"
+    "**Recommendations** - This is an AI-powered screening tool and not a medical diagnosis."
+)
+TRANSCRIPT = "The quick brown fox jumps over the lazy dog. This is a synthetic transcript."
+
+
+class UpstreamProfile:
+    """Latency (seconds) and error behaviour of one fake endpoint."""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float, error_status: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def delay(self, rng: random.Random) -> float:
+        return max(0.0, rng.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    profiles = {}
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+    stats = {"chat": 0, "whisper": 0, "errors": 0}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.startswith("/stats"):
+            self._send_json(200, self.stats)
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        # Drain the request body (multipart audio or JSON) before answering
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+
+        path = self.path.split("?", 1)[0]
+        if path.endswith("/chat/completions"):
+            kind = "chat"
+        elif path.endswith("/audio/transcriptions"):
+            kind = "whisper"
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+            return
+
+        profile = self.profiles[kind]
+        with self.rng_lock:
+            delay = profile.delay(self.rng)
+            failed = self.rng.random() < profile.error_rate
+            self.stats[kind] += 1
+            if failed:
+                self.stats["errors"] += 1
+        time.sleep(delay)
+
+        if failed:
+            self._send_json(profile.error_status, {
+                "error": {"code": str(profile.error_status), "message": "Injected failure from fake server"},
+            })
+        elif kind == "chat":
+            self._send_json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "gpt-4o",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": NARRATIVE},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 800, "completion_tokens": 400, "total_tokens": 1200},
+            })
+        else:
+            self._send_json(200, {"text": TRANSCRIPT})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Azure OpenAI server for load testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--chat-latency", type=float, default=2.0, help="Mean narrative latency (s)")
+    parser.add_argument("--chat-jitter", type=float, default=0.5, help="Std. dev. of narrative latency (s)")
+    parser.add_argument("--whisper-latency", type=float, default=1.0, help="Mean transcription latency (s)")
+    parser.add_argument("--whisper-jitter", type=float, default=0.3, help="Std. dev. of transcription latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of injected failures")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    FakeOpenAIHandler.rng = random.Random(args.seed)
+    FakeOpenAIHandler.profiles = {
+        "chat": UpstreamProfile(args.chat_latency, args.chat_jitter, args.error_rate, args.error_status),
+        "whisper": UpstreamProfile(args.whisper_latency, args.whisper_jitter, args.error_rate, args.error_status),
+    }
+    server = ThreadingHTTPServer((args.host, args.port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    print(f"Fake OpenAI server on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+End-to-End Load Test for /api/analyze
+
+Drives the backend with a repeatable mix of synthetic voice recordings of
+different lengths and formats at controlled concurrency, and reports:
+- Throughput and error rate
+- p50/p95/p99 client latency and per-stage server latency (timings_ms)
+- Per-worker request share and slot saturation, split into extraction
+  (CPU) time and time waiting on the upstream calls
+- Queue wait: client latency not spent in any server stage
+- Analysis quality tiers chosen under load
+
+It can run against an already running server (--url) or start the fake
+OpenAI server and gunicorn itself for each worker count (--workers), so the
+same report can be compared across worker counts and configurations.
+Requests are attributed to workers through the X-Worker-Pid header, which
+the backend only sends with EXPOSE_WORKER_PID=1 (set automatically for the
+gunicorn processes started here).
+
+The backend converts every non-wav upload with ffmpeg (pydub), so formats
+other than wav need ffmpeg on the server. Each format is sent once before
+measuring and the run stops if any fails, so reports are not dominated by
+setup errors. Workers are threaded by default because the quality governor
+only counts requests a worker has accepted; with sync workers (--threads 1)
+the reported tiers do not reflect load.
+
+Usage:
+    python load_test.py --workers 1,2,4 --concurrency 1,4,8 --requests 24 \\
+        --durations 5,30,90 --formats wav,flac --output report.json
+    python load_test.py --url http://localhost:5000 --concurrency 4
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import soundfile as sf
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_openai.py")
+STAGES = ["upload", "extract", "score", "transcribe", "narrative"]
+UPSTREAM_STAGES = {"transcribe", "narrative"}  # Waiting on the (fake) OpenAI server
+SOUNDFILE_FORMATS = {"wav": "WAV", "flac": "FLAC", "ogg": "OGG"}
+
+
+def synthesize_recording(duration: float, rng: np.random.Generator, sr: int = 16000) -> np.ndarray:
+    """Voice-like signal: harmonic phrases with drifting pitch separated by pauses."""
+    chunks = [0.002 * rng.standard_normal(int(rng.uniform(0.3, 1.5) * sr))]
+    total = len(chunks[0])
+    while total < duration * sr:
+        n = int(rng.uniform(1.5, 4.0) * sr)
+        t = np.arange(n) / sr
+        f0 = rng.uniform(90, 220) * (1 + 0.08 * np.sin(2 * np.pi * rng.uniform(0.3, 1.0) * t))
+        phase = 2 * np.pi * np.cumsum(f0) / sr
+        phrase = sum(np.sin(k * phase) / k for k in range(1, 8)) * 0.3
+        phrase *= np.hanning(n) ** 0.2
+        pause = 0.002 * rng.standard_normal(int(rng.uniform(0.2, 1.2) * sr))
+        chunks += [phrase + 0.004 * rng.standard_normal(n), pause]
+        total += n + len(pause)
+    return np.concatenate(chunks)[:int(duration * sr)].astype(np.float32)
+
+
+def write_recording(y: np.ndarray, path: str, fmt: str, sr: int = 16000):
+    if fmt in SOUNDFILE_FORMATS:
+        sf.write(path, y, sr, format=SOUNDFILE_FORMATS[fmt])
+        return
+    # Compressed browser formats go through ffmpeg like the backend does
+    from pydub import AudioSegment
+    wav_path = path + ".wav"
+    sf.write(wav_path, y, sr)
+    export_format = {"m4a": "ipod"}.get(fmt, fmt)
+    AudioSegment.from_wav(wav_path).export(path, format=export_format)
+    os.remove(wav_path)
+
+
+def build_corpus(durations: list, formats: list, directory: str, seed: int) -> list:
+    """One synthetic recording per (duration, format), identical across runs for a given seed."""
+    corpus = []
+    for d in durations:
+        y = synthesize_recording(d, np.random.default_rng([seed, int(d * 1000)]))
+        for fmt in formats:
+            path = os.path.join(directory, f"synthetic_{d:g}s.{fmt}")
+            write_recording(y, path, fmt)
+            with open(path, "rb") as f:
+                corpus.append({"duration": d, "format": fmt, "name": os.path.basename(path), "data": f.read()})
+    return corpus
+
+
+def encode_multipart(filename: str, data: bytes, fields: dict) -> tuple:
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="audio"; filename="{filename}"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n".encode() + data + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def send_analysis(url: str, recording: dict, fields: dict, timeout: float) -> dict:
+    body, content_type = encode_multipart(recording["name"], recording["data"], fields)
+    req = urllib.request.Request(f"{url}/api/analyze", data=body, headers={"Content-Type": content_type})
+    start = time.perf_counter()
+    result = {"duration": recording["duration"], "format": recording["format"], "status": 0}
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            payload = json.loads(resp.read())
+            result["status"] = resp.status
+            result["pid"] = resp.headers.get("X-Worker-Pid")
+    except urllib.error.HTTPError as e:
+        result["status"] = e.code
+        result["error"] = e.read()[:500].decode("utf-8", "replace")
+        payload = {}
+    except Exception as e:
+        result["error"] = str(e)
+        payload = {}
+    result["latency"] = time.perf_counter() - start
+    result["timings_ms"] = payload.get("timings_ms", {})
+    # Whatever the server stages do not account for was spent queued (or in transfer)
+    result["queue_wait"] = max(0.0, result["latency"] - sum(result["timings_ms"].values()) / 1000)
+    result["tier"] = (payload.get("analysis_quality") or {}).get("tier")
+    result["narrative_fallback"] = str(payload.get("narrative", "")).startswith("[AI narrative unavailable")
+    return result
+
+
+def _error_kind(result: dict) -> str:
+    return f"HTTP {result['status']}" if result["status"] else result.get("error", "unknown")
+
+
+def percentiles(values) -> dict:
+    if len(values) == 0:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3), "mean": round(float(np.mean(values)), 3)}
+
+
+def run_level(url: str, corpus: list, concurrency: int, n_requests: int, seed: int,
+              fields: dict, timeout: float, workers: int = None, threads: int = 1) -> dict:
+    """Send n_requests at the given concurrency and summarize the results.
+
+    Saturation is busy time over slot capacity (wall * threads per worker,
+    wall * workers * threads overall), split into extraction/scoring time and
+    time spent waiting on the upstream calls."""
+    rng = random.Random(seed * 1000 + concurrency)
+    plan = [rng.choice(corpus) for _ in range(n_requests)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda r: send_analysis(url, r, fields, timeout), plan))
+    wall = time.perf_counter() - start
+
+    ok = [r for r in results if r["status"] == 200]
+    per_worker = {}
+    for r in ok:
+        w = per_worker.setdefault(str(r.get("pid")), {"requests": 0, "cpu_sec": 0.0, "upstream_sec": 0.0})
+        w["requests"] += 1
+        for stage, ms in r["timings_ms"].items():
+            w["upstream_sec" if stage in UPSTREAM_STAGES else "cpu_sec"] += ms / 1000
+    cpu = sum(w["cpu_sec"] for w in per_worker.values())
+    upstream = sum(w["upstream_sec"] for w in per_worker.values())
+    for w in per_worker.values():
+        w["busy_fraction"] = round((w["cpu_sec"] + w["upstream_sec"]) / (wall * threads), 3)
+        w["cpu_fraction"] = round(w["cpu_sec"] / (wall * threads), 3)
+        w["cpu_sec"] = round(w["cpu_sec"], 2)
+        w["upstream_sec"] = round(w["upstream_sec"], 2)
+
+    summary = {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "ok": len(ok),
+        "errors": n_requests - len(ok),
+        "error_kinds": {
+            k: sum(1 for r in results if r["status"] != 200 and _error_kind(r) == k)
+            for k in sorted({_error_kind(r) for r in results if r["status"] != 200})
+        },
+        "narrative_fallbacks": sum(r["narrative_fallback"] for r in ok),
+        "wall_sec": round(wall, 2),
+        "throughput_rps": round(len(ok) / wall, 3) if wall > 0 else 0.0,
+        "latency_sec": percentiles([r["latency"] for r in ok]),
+        "queue_wait_sec": percentiles([r["queue_wait"] for r in ok]),
+        "stages_ms": {s: percentiles([r["timings_ms"][s] for r in ok if s in r["timings_ms"]]) for s in STAGES},
+        "latency_by_duration_sec": {
+            f"{d:g}s": percentiles([r["latency"] for r in ok if r["duration"] == d])
+            for d in sorted({r["duration"] for r in results})
+        },
+        "tiers": {t: sum(r["tier"] == t for r in ok) for t in sorted({r["tier"] for r in ok if r["tier"]})},
+        "workers": per_worker,
+    }
+    if workers:
+        slots = wall * workers * threads
+        summary["worker_saturation"] = round((cpu + upstream) / slots, 3)
+        summary["cpu_saturation"] = round(cpu / slots, 3)
+        summary["upstream_wait_share"] = round(upstream / slots, 3)
+    return summary
+
+
+def preflight(url: str, corpus: list, fields: dict, timeout: float):
+    """Send the shortest recording of each format once; fail fast on setup errors."""
+    failures = []
+    for fmt in sorted({r["format"] for r in corpus}):
+        recording = min((r for r in corpus if r["format"] == fmt), key=lambda r: r["duration"])
+        result = send_analysis(url, recording, fields, timeout)
+        if result["status"] != 200:
+            failures.append(f"{fmt}: {_error_kind(result)} {result.get('error', '')[:200]}")
+    if failures:
+        raise RuntimeError("Preflight failed (non-wav formats need ffmpeg on the server):\n  "
+                           + "\n  ".join(failures))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 120.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return
+        except Exception:
+            time.sleep(0.5)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def start_fake_server(args) -> tuple:
+    port = free_port()
+    proc = subprocess.Popen([
+        sys.executable, FAKE_SERVER, "--port", str(port),
+        "--chat-latency", str(args.chat_latency), "--chat-jitter", str(args.chat_jitter),
+        "--whisper-latency", str(args.whisper_latency), "--whisper-jitter", str(args.whisper_jitter),
+        "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+        "--seed", str(args.seed),
+    ], stdout=subprocess.DEVNULL)
+    wait_for(f"http://127.0.0.1:{port}/stats")
+    return proc, f"http://127.0.0.1:{port}"
+
+
+def start_backend(workers: int, threads: int, upstream_url: str, baseline_dir: str) -> tuple:
+    port = free_port()
+    # Private slot directory so queue depth only counts this run's analyses
+    state_dir = tempfile.mkdtemp(prefix="inflight-", dir=os.path.dirname(baseline_dir))
+    env = dict(os.environ, URL_OPEN=upstream_url, OPEN_IA="fake-key", BASELINE_DIR=baseline_dir,
+               QUALITY_STATE_DIR=state_dir, EXPOSE_WORKER_PID="1")
+    cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), "--threads", str(threads),
+           "-b", f"127.0.0.1:{port}", "--timeout", "600", "app:app"]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for(f"http://127.0.0.1:{port}/api/health")
+    return proc, f"http://127.0.0.1:{port}"
+
+
+def stop(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def print_summary(label: str, level: dict):
+    lat, ext, queue = level["latency_sec"], level["stages_ms"]["extract"], level["queue_wait_sec"]
+    sat, cpu = level.get("worker_saturation", "-"), level.get("cpu_saturation", "-")
+    print(
+        f"{label:<14} c={level['concurrency']:<3} ok={level['ok']:<4} err={level['errors']:<3} "
+        f"rps={level['throughput_rps']:<7} p50={lat['p50']}s p95={lat['p95']}s p99={lat['p99']}s "
+        f"queue_p95={queue['p95']}s extract_p95={ext['p95']}ms sat={sat} cpu={cpu} tiers={level['tiers']}",
+        flush=True,
+    )
+
+
+def parse_list(value: str, cast=str) -> list:
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/analyze with synthetic recordings.")
+    parser.add_argument("--url", help="Test an already running backend instead of starting gunicorn")
+    parser.add_argument("--workers", default="2", help="Gunicorn worker counts to compare, e.g. 1,2,4")
+    parser.add_argument("--threads", type=int, default=4,
+                        help="Threads per gunicorn worker (1 = sync workers; tiers then ignore queueing)")
+    parser.add_argument("--concurrency", default="1,4", help="Client concurrency levels, e.g. 1,4,8")
+    parser.add_argument("--requests", type=int, default=16, help="Requests per concurrency level")
+    parser.add_argument("--durations", default="5,30", help="Recording lengths in seconds")
+    parser.add_argument("--formats", default="wav",
+                        help="wav, flac, ogg, mp3, webm, m4a; every non-wav format needs ffmpeg on the server")
+    parser.add_argument("--contours", default="", help="Value of the 'contours' field to send")
+    parser.add_argument("--quality", default="", help="Value of the 'quality' field to send")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Client timeout per request (s)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--label", default="", help="Name of this configuration in the report")
+    parser.add_argument("--output", default="loadtest_report.json")
+    fake = parser.add_argument_group("fake upstream (ignored with --url)")
+    fake.add_argument("--chat-latency", type=float, default=2.0)
+    fake.add_argument("--chat-jitter", type=float, default=0.5)
+    fake.add_argument("--whisper-latency", type=float, default=1.0)
+    fake.add_argument("--whisper-jitter", type=float, default=0.3)
+    fake.add_argument("--error-rate", type=float, default=0.0)
+    fake.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.threads < 2 and not args.url:
+        print("Warning: --threads 1 runs sync workers; reported tiers will not respond to load",
+              file=sys.stderr, flush=True)
+
+    non_wav = [f for f in parse_list(args.formats) if f != "wav"]
+    if non_wav and not args.url and not (shutil.which("ffmpeg") and shutil.which("ffprobe")):
+        parser.error(f"formats {', '.join(non_wav)} need ffmpeg/ffprobe on PATH for the backend")
+
+    fields = {k: v for k, v in (("contours", args.contours), ("quality", args.quality)) if v}
+    concurrency_levels = parse_list(args.concurrency, int)
+    workdir = tempfile.mkdtemp(prefix="neurovox_loadtest_")
+    try:
+        corpus = build_corpus(parse_list(args.durations, float), parse_list(args.formats), workdir, args.seed)
+
+        report = {
+            "label": args.label,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {k: v for k, v in vars(args).items() if k != "output"},
+            "corpus": [{"duration": r["duration"], "format": r["format"], "bytes": len(r["data"])} for r in corpus],
+            "runs": [],
+        }
+
+        if args.url:
+            preflight(args.url, corpus, fields, args.timeout)
+            run = {"workers": None, "threads": None, "levels": []}
+            for c in concurrency_levels:
+                level = run_level(args.url, corpus, c, args.requests, args.seed, fields, args.timeout)
+                print_summary("external", level)
+                run["levels"].append(level)
+            report["runs"].append(run)
+        else:
+            fake_proc, upstream = start_fake_server(args)
+            try:
+                for workers in parse_list(args.workers, int):
+                    backend, url = start_backend(workers, args.threads, upstream, os.path.join(workdir, "baselines"))
+                    try:
+                        preflight(url, corpus, fields, args.timeout)
+                        # Warm up every worker (imports, numba JIT) before measuring
+                        run_level(url, corpus[:1], workers, workers * 2, args.seed, fields, args.timeout)
+                        run = {
+                            "workers": workers,
+                            "threads": args.threads,
+                            "worker_class": "gthread" if args.threads > 1 else "sync",
+                            "load_driven_tiers": args.threads > 1,
+                            "levels": [],
+                        }
+                        for c in concurrency_levels:
+                            level = run_level(url, corpus, c, args.requests, args.seed, fields,
+                                              args.timeout, workers, args.threads)
+                            print_summary(f"workers={workers}", level)
+                            run["levels"].append(level)
+                        report["runs"].append(run)
+                    finally:
+                        stop(backend)
+            finally:
+                stop(fake_proc)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
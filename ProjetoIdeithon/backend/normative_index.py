@@ -0,0 +1,260 @@
+"""
+Normative Percentile Index for Voice Biomarkers
+Based on research from:
+- DementiaBank Pitt Corpus normative data
+- eGeMAPS reference ranges (Eyben et al., 2016)
+- Dunning & Ertl (2019): Computing extremely accurate quantiles using t-digests
+
+Reports each biomarker as a percentile of a normative population stratified
+by age band and sex, instead of a fixed healthy range.
+
+The index is built offline from a reference table (CSV with `age`, `sex` and
+one column per biomarker) into one weighted, sorted quantile sketch per
+(stratum, biomarker). Sketches are bounded in size and can be merged, so new
+normative data is folded in without rebuilding from the raw table.
+
+Usage:
+    python normative_index.py build reference.csv normative_index.npz
+    python normative_index.py merge normative_index.npz new_reference.csv
+"""
+
+import csv
+import argparse
+import numpy as np
+
+
+AGE_BANDS = [
+    (0, 50, "<50"),
+    (50, 65, "50-64"),
+    (65, 75, "65-74"),
+    (75, 200, "75+"),
+]
+ANY = "*"
+
+
+def age_band(age) -> str:
+    """Map an age in years to its stratum label."""
+    try:
+        age = float(age)
+    except (TypeError, ValueError):
+        return ANY
+    for low, high, label in AGE_BANDS:
+        if low <= age < high:
+            return label
+    return ANY
+
+
+def normalize_sex(sex) -> str:
+    sex = (sex or "").strip().upper()[:1]
+    return sex if sex in ("F", "M") else ANY
+
+
+def stratum_key(age, sex) -> str:
+    return f"{normalize_sex(sex)}|{age_band(age)}"
+
+
+def fallback_keys(age, sex) -> list:
+    """Strata to try, from most to least specific."""
+    sex, band = normalize_sex(sex), age_band(age)
+    keys = [f"{sex}|{band}", f"{sex}|{ANY}", f"{ANY}|{band}", f"{ANY}|{ANY}"]
+    return list(dict.fromkeys(keys))
+
+
+class QuantileSketch:
+    """Sorted (value, weight) centroids with a bounded number of points.
+
+    Equal values are merged into one centroid carrying their total weight, so
+    ties get their mid-rank percentile. Populations with more than `max_size`
+    distinct values are compressed with the t-digest arcsine scale: centroids
+    are small in the tails and large around the median, which keeps extreme
+    percentiles accurate. Percentile lookup is a binary search over the
+    centroids and is vectorized over the queries."""
+
+    def __init__(self, values=None, weights=None, max_size: int = 2048):
+        self.max_size = max_size
+        values = np.asarray(values if values is not None else [], dtype=np.float64)
+        weights = (np.ones_like(values) if weights is None
+                   else np.asarray(weights, dtype=np.float64))
+        finite = np.isfinite(values)
+        # np.unique sorts and groups ties; their weights are summed
+        self.values, inverse = np.unique(values[finite], return_inverse=True)
+        self.weights = np.bincount(inverse, weights=weights[finite], minlength=len(self.values))
+        self._compress()
+        self._prepare()
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Return a new sketch covering both populations."""
+        return QuantileSketch(
+            np.concatenate([self.values, other.values]),
+            np.concatenate([self.weights, other.weights]),
+            max_size=max(self.max_size, other.max_size),
+        )
+
+    def percentile(self, x) -> np.ndarray:
+        """Percentile (0-100) of each query value within the population."""
+        x = np.asarray(x, dtype=np.float64)
+        if len(self.values) == 0:
+            return np.full(x.shape, np.nan)
+        return np.interp(x, self.values, self._mid_percentiles, left=0.0, right=100.0)
+
+    def quantile(self, q) -> np.ndarray:
+        """Value at each percentile q (0-100); inverse of percentile()."""
+        q = np.asarray(q, dtype=np.float64)
+        if len(self.values) == 0:
+            return np.full(q.shape, np.nan)
+        return np.interp(q, self._mid_percentiles, self.values)
+
+    def _prepare(self):
+        # Percentile at the middle of each centroid, precomputed so lookups are a binary search
+        cum = np.cumsum(self.weights)
+        total = cum[-1] if len(cum) else 1.0
+        self._mid_percentiles = (cum - self.weights / 2) / total * 100
+
+    def _compress(self):
+        if len(self.values) <= self.max_size:
+            return
+        cum = np.cumsum(self.weights)
+        q = (cum - self.weights / 2) / cum[-1]
+        # t-digest k1 scale: equal steps in arcsin(2q - 1) give narrow bins near q=0 and q=1
+        k = np.arcsin(np.clip(2 * q - 1, -1.0, 1.0)) / np.pi + 0.5
+        bins = np.minimum((k * self.max_size).astype(np.int64), self.max_size - 1)
+        w = np.bincount(bins, weights=self.weights, minlength=self.max_size)
+        vw = np.bincount(bins, weights=self.values * self.weights, minlength=self.max_size)
+        keep = w > 0
+        self.weights = w[keep]
+        self.values = vw[keep] / self.weights
+
+
+class NormativeIndex:
+    """Per-stratum quantile sketches for each normative biomarker."""
+
+    def __init__(self, sketches: dict = None, max_size: int = 2048):
+        # {stratum_key: {biomarker: QuantileSketch}}
+        self.sketches = sketches or {}
+        self.max_size = max_size
+
+    @property
+    def biomarkers(self) -> set:
+        return {b for per_stratum in self.sketches.values() for b in per_stratum}
+
+    @classmethod
+    def from_table(cls, rows: list, max_size: int = 2048) -> "NormativeIndex":
+        """Build an index from reference rows (dicts with age, sex and biomarker columns)."""
+        grouped = {}
+        for row in rows:
+            strata = fallback_keys(row.get("age"), row.get("sex"))
+            for column, raw in row.items():
+                if column in ("age", "sex") or raw in (None, ""):
+                    continue
+                try:
+                    value = float(raw)
+                except ValueError:
+                    continue
+                for key in strata:
+                    grouped.setdefault(key, {}).setdefault(column, []).append(value)
+
+        sketches = {
+            key: {b: QuantileSketch(vals, max_size=max_size) for b, vals in per_b.items()}
+            for key, per_b in grouped.items()
+        }
+        return cls(sketches, max_size=max_size)
+
+    @classmethod
+    def from_csv(cls, path: str, max_size: int = 2048) -> "NormativeIndex":
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            return cls.from_table(list(csv.DictReader(f)), max_size=max_size)
+
+    def merge(self, other: "NormativeIndex") -> "NormativeIndex":
+        """Return a new index combining both populations stratum by stratum."""
+        merged = {key: dict(per_b) for key, per_b in self.sketches.items()}
+        for key, per_b in other.sketches.items():
+            target = merged.setdefault(key, {})
+            for b, sketch in per_b.items():
+                target[b] = target[b].merge(sketch) if b in target else sketch
+        return NormativeIndex(merged, max_size=max(self.max_size, other.max_size))
+
+    def lookup(self, biomarker: str, values, age=None, sex=None) -> tuple:
+        """Vectorized percentile lookup for a batch of values of one biomarker,
+        using the most specific stratum that has data.
+        Returns (stratum key used or None, percentiles)."""
+        for key in fallback_keys(age, sex):
+            sketch = self.sketches.get(key, {}).get(biomarker)
+            if sketch is not None and len(sketch.values) > 0:
+                return key, sketch.percentile(values)
+        return None, np.full(np.shape(values), np.nan)
+
+    def percentiles(self, biomarkers: dict, age=None, sex=None) -> dict:
+        """Percentile of every indexed biomarker in a single recording, each with
+        the stratum it was computed against (a fallback when the requested
+        age/sex stratum has no data for that biomarker)."""
+        result = {}
+        for b in sorted(self.biomarkers):
+            if b not in biomarkers:
+                continue
+            key, p = self.lookup(b, biomarkers[b], age, sex)
+            p = float(p)
+            if not np.isnan(p):
+                result[b] = {"percentile": round(p, 1), "stratum": key}
+        return {
+            "requested_stratum": stratum_key(age, sex),
+            "percentiles": result,
+        }
+
+    def save(self, path: str):
+        arrays = {}
+        for key, per_b in self.sketches.items():
+            for b, sketch in per_b.items():
+                arrays[f"{key}::{b}::values"] = sketch.values
+                arrays[f"{key}::{b}::weights"] = sketch.weights
+        arrays["__max_size__"] = np.array([self.max_size])
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "NormativeIndex":
+        data = np.load(path, allow_pickle=False)
+        max_size = int(data["__max_size__"][0]) if "__max_size__" in data.files else 2048
+        sketches = {}
+        for name in data.files:
+            if not name.endswith("::values"):
+                continue
+            key, b, _ = name.split("::")
+            sketch = QuantileSketch.__new__(QuantileSketch)
+            sketch.max_size = max_size
+            sketch.values = data[name]
+            sketch.weights = data[f"{key}::{b}::weights"]
+            sketch._prepare()
+            sketches.setdefault(key, {})[b] = sketch
+        return cls(sketches, max_size=max_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the normative percentile index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Build an index from a reference CSV")
+    build.add_argument("reference_csv")
+    build.add_argument("output")
+    build.add_argument("--max-size", type=int, default=2048)
+
+    merge = sub.add_parser("merge", help="Merge new reference data into an existing index")
+    merge.add_argument("index")
+    merge.add_argument("reference_csv")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        index = NormativeIndex.from_csv(args.reference_csv, max_size=args.max_size)
+        index.save(args.output)
+        print(f"Built {args.output}: {len(index.sketches)} strata, {len(index.biomarkers)} biomarkers")
+    else:
+        index = NormativeIndex.load(args.index)
+        index = index.merge(NormativeIndex.from_csv(args.reference_csv, max_size=index.max_size))
+        index.save(args.index)
+        print(f"Updated {args.index}: {len(index.sketches)} strata, {len(index.biomarkers)} biomarkers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Per-Patient Voice Baselines for Longitudinal Monitoring
+Based on research from:
+- Harvard/Frontiers: Longitudinal Speech Biomarkers (OVBM)
+- Page (1954): Continuous inspection schemes (CUSUM)
+- Welford (1962): Running mean and variance
+
+Each patient keeps a small set of running statistics per biomarker:
+- Count, running mean and M2 (Welford) for mean/variance
+- Exponentially weighted moving average (EWMA) of recent visits
+- Two-sided CUSUM on the standardized deviation for slow drift
+
+Every new recording is compared against the statistics of the previous
+visits and then folded in, so each analysis costs O(1) per biomarker
+regardless of how many visits the patient already has.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+
+# Biomarkers followed over time (keys produced by VoiceBiomarkerExtractor)
+TRACKED_BIOMARKERS = [
+    "jitter_local",
+    "shimmer_local",
+    "hnr_mean",
+    "f0_mean",
+    "f0_cv",
+    "silence_ratio",
+    "speech_ratio",
+    "avg_pause_duration",
+    "energy_range",
+    "spectral_centroid_std",
+    "f1_std",
+    "f2_std",
+]
+
+# The extractor reports 0.0 for these when no voiced frame was found;
+# a zero is a missing measurement, not a value to fold into the baseline
+ZERO_MEANS_MISSING = {
+    "jitter_local", "shimmer_local", "hnr_mean", "f0_mean", "f0_cv", "f1_std", "f2_std",
+}
+
+
+def measured_value(biomarkers: dict, key: str):
+    """The biomarker as a float, or None if it is absent, non-finite or a zero fallback."""
+    if key not in biomarkers:
+        return None
+    value = float(biomarkers[key])
+    if not np.isfinite(value) or (value == 0.0 and key in ZERO_MEANS_MISSING):
+        return None
+    return value
+
+
+class PatientBaseline:
+    """Incrementally updated statistics of one patient's past recordings.
+    Statistics are kept per analysis quality tier so that results computed at
+    different resolutions are never compared with each other."""
+
+    EWMA_ALPHA = 0.3       # Weight of the newest visit in the EWMA
+    CUSUM_K = 0.5          # Slack (in standard deviations) before drift accumulates
+    CUSUM_H = 4.0          # Decision threshold for flagging sustained drift
+    MIN_VISITS = 3         # Visits required before z-scores are meaningful
+    MIN_RELATIVE_STD = 0.05  # Std. dev. floor as a fraction of the baseline mean
+
+    def __init__(self, patient_id: str, stats: dict = None):
+        self.patient_id = patient_id
+        self.stats = stats or {}  # {tier: {biomarker: running statistics}}
+
+    def visit_count(self, tier: str = "full") -> int:
+        return max((s["n"] for s in self.stats.get(tier, {}).values()), default=0)
+
+    def compare(self, biomarkers: dict, tier: str = "full") -> dict:
+        """Change of a new recording against the baseline built so far at the same tier.
+        Must be called before update() so the recording is not compared with itself."""
+        stats = self.stats.get(tier, {})
+        changes = {}
+        drift_flags = []
+
+        for key in TRACKED_BIOMARKERS:
+            if key not in biomarkers:
+                continue
+            value = measured_value(biomarkers, key)
+            if value is None:
+                changes[key] = {"status": "not_measured"}
+                continue
+            s = stats.get(key)
+            if not s or s["n"] == 0:
+                changes[key] = {"value": round(value, 4), "status": "no_baseline"}
+                continue
+
+            std = self._std(s)
+            delta = value - s["mean"]
+            z = delta / std
+            cusum_pos, cusum_neg = self._next_cusum(s, z)
+
+            if s["n"] < self.MIN_VISITS:
+                status = "building"
+            elif max(cusum_pos, cusum_neg) > self.CUSUM_H:
+                status = "drift"
+                drift_flags.append(
+                    f"{key} drifting {'up' if cusum_pos > cusum_neg else 'down'} vs. baseline"
+                )
+            elif abs(z) > 2.0:
+                status = "changed"
+            else:
+                status = "stable"
+
+            changes[key] = {
+                "value": round(value, 4),
+                "baseline_mean": round(s["mean"], 4),
+                "baseline_std": round(float(np.sqrt(s["m2"] / (s["n"] - 1))) if s["n"] > 1 else 0.0, 4),
+                "ewma": round(s["ewma"], 4),
+                "delta": round(delta, 4),
+                "delta_percent": round(delta / s["mean"] * 100, 1) if s["mean"] != 0 else 0.0,
+                "z_score": round(z, 2),
+                "status": status,
+            }
+
+        return {
+            "patient_id": self.patient_id,
+            "tier": tier,
+            "previous_visits": self.visit_count(tier),
+            "changes": changes,
+            "drift_flags": drift_flags,
+        }
+
+    def update(self, biomarkers: dict, tier: str = "full"):
+        """Fold a new recording into the tier's running statistics in O(1) per biomarker."""
+        stats = self.stats.setdefault(tier, {})
+        for key in TRACKED_BIOMARKERS:
+            value = measured_value(biomarkers, key)
+            if value is None:
+                continue
+            s = stats.get(key)
+            if s is None:
+                stats[key] = {
+                    "n": 1, "mean": value, "m2": 0.0, "ewma": value,
+                    "cusum_pos": 0.0, "cusum_neg": 0.0,
+                }
+                continue
+
+            # CUSUM is driven by the deviation from the baseline *before* this visit
+            if s["n"] > 1:
+                z = (value - s["mean"]) / self._std(s)
+                s["cusum_pos"], s["cusum_neg"] = self._next_cusum(s, z)
+
+            # Welford running mean / variance
+            s["n"] += 1
+            delta = value - s["mean"]
+            s["mean"] += delta / s["n"]
+            s["m2"] += delta * (value - s["mean"])
+
+            s["ewma"] = self.EWMA_ALPHA * value + (1 - self.EWMA_ALPHA) * s["ewma"]
+
+    def _std(self, s: dict) -> float:
+        """Sample std. dev. with a floor, so identical past visits do not turn
+        every later change into z = 0 (or a division by zero)."""
+        std = float(np.sqrt(s["m2"] / (s["n"] - 1))) if s["n"] > 1 else 0.0
+        return max(std, abs(s["mean"]) * self.MIN_RELATIVE_STD, 1e-6)
+
+    def _next_cusum(self, s: dict, z: float) -> tuple:
+        return (
+            float(max(0.0, s["cusum_pos"] + z - self.CUSUM_K)),
+            float(max(0.0, s["cusum_neg"] - z - self.CUSUM_K)),
+        )
+
+    def to_dict(self) -> dict:
+        # The patient identifier is deliberately not persisted; the hashed file name identifies it
+        return {"stats": self.stats}
+
+    @classmethod
+    def from_dict(cls, patient_id: str, data: dict) -> "PatientBaseline":
+        return cls(patient_id, data.get("stats", {}))
+
+
+class PatientBaselineStore:
+    """Persists one small JSON document per patient.
+    File names are hashed and documents hold only statistics, so raw patient
+    identifiers never reach the filesystem. A per-patient file lock serializes
+    updates across gunicorn worker processes."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, patient_id: str, suffix: str = ".json") -> str:
+        digest = hashlib.sha256(patient_id.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, f"{digest}{suffix}")
+
+    @contextmanager
+    def _patient_lock(self, patient_id: str):
+        if fcntl is None:
+            # No flock (Windows): serialize updates within this process only
+            with self._lock:
+                yield
+            return
+        # Each open() gets its own file description, so flock also excludes
+        # other threads of this worker, and only for the same patient
+        with open(self._path(patient_id, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load(self, patient_id: str) -> PatientBaseline:
+        path = self._path(patient_id)
+        if not os.path.exists(path):
+            return PatientBaseline(patient_id)
+        with open(path, "r", encoding="utf-8") as f:
+            return PatientBaseline.from_dict(patient_id, json.load(f))
+
+    def save(self, baseline: PatientBaseline):
+        path = self._path(baseline.patient_id)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(baseline.to_dict(), f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def compare_and_update(self, patient_id: str, biomarkers: dict, tier: str = "full") -> dict:
+        """Compare a recording with the patient's baseline, then record it.
+        The whole load-update-save runs under the patient's lock so no visit is lost."""
+        with self._patient_lock(patient_id):
+            baseline = self.load(patient_id)
+            comparison = baseline.compare(biomarkers, tier)
+            baseline.update(biomarkers, tier)
+            self.save(baseline)
+        return comparison
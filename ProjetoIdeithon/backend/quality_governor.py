@@ -0,0 +1,127 @@
+"""
+Adaptive Analysis Quality Selection
+
+Picks an analysis tier (see voice_analyzer.ANALYSIS_TIERS) for each request
+from the current load of the server:
+- Queue depth: analyses in flight across all worker processes, including the
+  new one. Each in-flight analysis holds a small slot file in a shared
+  directory; slots of dead processes are discarded.
+- Latency SLO: a real-time factor (extraction seconds per analysed second of
+  audio), so long and short uploads are judged alike. The SLO applies to the
+  full tier: measurements from coarser tiers are scaled back by their
+  relative_cost, and the finest tier whose estimated real-time factor meets
+  the SLO is used.
+
+Under load a slightly coarser result returned quickly is preferred over a
+full-resolution analysis that times out.
+
+Queue depth only sees requests a worker has accepted. With gunicorn's default
+sync workers each process accepts one request at a time and the rest wait in
+the listen backlog, so run threaded workers (e.g. `--threads 4`) for the
+depth limits to take effect.
+"""
+
+import os
+import time
+import uuid
+import tempfile
+import threading
+from contextlib import contextmanager
+from voice_analyzer import ANALYSIS_TIERS, TIER_ORDER
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class QualityGovernor:
+    """Chooses the analysis tier from server-wide in-flight requests and the
+    recent real-time factor of this worker."""
+
+    def __init__(self, standard_depth: int = 2, fast_depth: int = 4,
+                 rtf_slo: float = 0.3, ewma_alpha: float = 0.2, state_dir: str = None):
+        self.standard_depth = standard_depth  # In-flight analyses above which "standard" is used
+        self.fast_depth = fast_depth          # In-flight analyses above which "fast" is used
+        self.rtf_slo = rtf_slo                # Target full-tier extraction seconds per audio second
+        self.ewma_alpha = ewma_alpha
+        self.state_dir = state_dir or os.path.join(tempfile.gettempdir(), "neurovox_inflight")
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.rtf_ewma = 0.0                   # Full-tier equivalent real-time factor
+        self._lock = threading.Lock()
+
+    def _in_flight(self) -> int:
+        """Count live slot files, removing those left behind by dead workers."""
+        count = 0
+        for name in os.listdir(self.state_dir):
+            try:
+                pid = int(name.split("-", 1)[0])
+            except ValueError:
+                continue
+            if _pid_alive(pid):
+                count += 1
+            else:
+                try:
+                    os.remove(os.path.join(self.state_dir, name))
+                except OSError:
+                    pass
+        return count
+
+    def _select(self, depth: int, requested: str = None) -> tuple:
+        level, reason = 0, "normal load"
+        if depth > self.fast_depth:
+            level, reason = 2, f"queue depth {depth} > {self.fast_depth}"
+        elif depth > self.standard_depth:
+            level, reason = 1, f"queue depth {depth} > {self.standard_depth}"
+
+        if self.rtf_ewma > 0:
+            # Finest tier whose estimated real-time factor meets the SLO
+            latency_level = len(TIER_ORDER) - 1
+            for i, tier in enumerate(TIER_ORDER):
+                if self.rtf_ewma * ANALYSIS_TIERS[tier]["relative_cost"] <= self.rtf_slo:
+                    latency_level = i
+                    break
+            if latency_level > level:
+                level = latency_level
+                reason = f"real-time factor {self.rtf_ewma:.2f} over {self.rtf_slo:.2f} SLO"
+
+        # Clients may ask for a coarser tier, never a finer one than the load allows
+        if requested in TIER_ORDER and TIER_ORDER.index(requested) > level:
+            level, reason = TIER_ORDER.index(requested), "requested by client"
+
+        return TIER_ORDER[level], reason
+
+    @contextmanager
+    def track(self, requested: str = None):
+        """Reserve a slot for one analysis and yield the tier to run it at.
+        The caller sets "audio_seconds" on the yielded dict to the analysed
+        duration; the real-time factor is folded into the average on exit."""
+        slot = os.path.join(self.state_dir, f"{os.getpid()}-{uuid.uuid4().hex}")
+        open(slot, "w").close()
+        try:
+            depth = self._in_flight()
+            with self._lock:
+                tier, reason = self._select(depth, requested)
+            quality = {"tier": tier, "reason": reason, "in_flight": depth}
+            start = time.perf_counter()
+            yield quality
+            elapsed = time.perf_counter() - start
+        finally:
+            try:
+                os.remove(slot)
+            except OSError:
+                pass
+
+        audio_seconds = quality.get("audio_seconds") or 0
+        if audio_seconds > 0:
+            rtf = elapsed / audio_seconds / ANALYSIS_TIERS[tier]["relative_cost"]
+            with self._lock:
+                if self.rtf_ewma == 0.0:
+                    self.rtf_ewma = rtf
+                else:
+                    self.rtf_ewma = self.ewma_alpha * rtf + (1 - self.ewma_alpha) * self.rtf_ewma
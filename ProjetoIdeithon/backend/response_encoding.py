@@ -0,0 +1,161 @@
+"""
+Response Projection, Encoding and Caching
+
+Keeps API payloads small for clients on slow networks:
+- Field projection: `fields=risk_assessment.overall_score,biomarkers.pitch`
+- Content negotiation: JSON or MessagePack (Accept: application/msgpack)
+- Compression: brotli or gzip (Accept-Encoding), applied to large bodies
+- Static payloads serialized and compressed once, served with ETag,
+  Cache-Control and If-None-Match support
+
+MessagePack and brotli are optional; without them the server falls back to
+JSON and gzip.
+"""
+
+import gzip
+import json
+import hashlib
+from flask import Response
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+COMPRESSIBLE_MIMETYPES = {JSON_MIMETYPE, MSGPACK_MIMETYPE}
+MIN_COMPRESS_BYTES = 1024
+
+
+def parse_fields(value: str) -> list:
+    """Comma-separated dotted paths, e.g. "risk_assessment.overall_score,narrative"."""
+    return [f.strip() for f in (value or "").split(",") if f.strip()]
+
+
+def wants(fields: list, key: str) -> bool:
+    """Whether a top-level key is covered by the projection (no projection = everything)."""
+    return not fields or any(f == key or f.startswith(key + ".") for f in fields)
+
+
+def project(payload: dict, fields: list) -> dict:
+    """Keep only the requested dotted paths of a nested dict. Unknown paths are ignored."""
+    if not fields:
+        return payload
+    result = {}
+    for path in fields:
+        parts = path.split(".")
+        src, dst = payload, result
+        for i, part in enumerate(parts):
+            if not isinstance(src, dict) or part not in src:
+                break
+            if i == len(parts) - 1:
+                dst[part] = src[part]
+            else:
+                src = src[part]
+                dst = dst.setdefault(part, {})
+                if dst is src:
+                    break
+    if "success" in payload:
+        result["success"] = payload["success"]
+    return result
+
+
+def negotiate_mimetype(request) -> str:
+    offered = [JSON_MIMETYPE] + ([MSGPACK_MIMETYPE] if msgpack is not None else [])
+    return request.accept_mimetypes.best_match(offered, default=JSON_MIMETYPE)
+
+
+def negotiate_encoding(request) -> str:
+    """Preferred content-coding supported on both sides, or None for identity."""
+    offered = (["br"] if brotli is not None else []) + ["gzip"]
+    best = request.accept_encodings.best_match(offered)
+    return best if best in offered else None
+
+
+def serialize(payload, mimetype: str) -> bytes:
+    if mimetype == MSGPACK_MIMETYPE:
+        return msgpack.packb(payload, use_bin_type=True)
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    return data
+
+
+def add_vary(response, *headers):
+    existing = [h.strip() for h in response.headers.get("Vary", "").split(",") if h.strip()]
+    for header in headers:
+        if header not in existing:
+            existing.append(header)
+    response.headers["Vary"] = ", ".join(existing)
+
+
+def payload_response(request, payload, status: int = 200) -> Response:
+    """Serialize a payload in the format the client accepts.
+    Compression is left to compress_response()."""
+    mimetype = negotiate_mimetype(request)
+    response = Response(serialize(payload, mimetype), status=status, mimetype=mimetype)
+    add_vary(response, "Accept")
+    return response
+
+
+def compress_response(request, response):
+    """after_request hook: compress large JSON/MessagePack bodies the client can decode."""
+    if (response.direct_passthrough
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or "Content-Encoding" in response.headers
+            or response.status_code < 200 or response.status_code >= 300):
+        return response
+    add_vary(response, "Accept-Encoding")
+    encoding = negotiate_encoding(request)
+    data = response.get_data()
+    if encoding is None or len(data) < MIN_COMPRESS_BYTES:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+class StaticPayload:
+    """A payload that never changes while the process runs.
+    Every (format, encoding) variant is serialized once at startup."""
+
+    def __init__(self, payload, max_age: int = 86400):
+        self.max_age = max_age
+        self.etag = hashlib.sha256(serialize(payload, JSON_MIMETYPE)).hexdigest()[:20]
+        self.variants = {}
+        mimetypes = [JSON_MIMETYPE] + ([MSGPACK_MIMETYPE] if msgpack is not None else [])
+        encodings = [None, "gzip"] + (["br"] if brotli is not None else [])
+        for mimetype in mimetypes:
+            data = serialize(payload, mimetype)
+            for encoding in encodings:
+                self.variants[(mimetype, encoding)] = compress(data, encoding)
+
+    def respond(self, request) -> Response:
+        mimetype = negotiate_mimetype(request)
+        encoding = negotiate_encoding(request)
+        # One strong validator per representation; all share the content hash
+        suffix = "".join(f"-{part}" for part in (mimetype.split("/")[1], encoding) if part != "json" and part)
+        etag = f"{self.etag}{suffix}"
+
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(self.variants[(mimetype, encoding)], mimetype=mimetype)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = f"public, max-age={self.max_age}"
+        add_vary(response, "Accept", "Accept-Encoding")
+        return response
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from normative_index import NormativeIndex, QuantileSketch, age_band
+
+
+def test_tied_values_get_mid_rank_percentile():
+    sketch = QuantileSketch([1, 2, 3, 3, 3, 3, 3, 3, 4, 5])
+    assert sketch.percentile(3) == pytest.approx(50.0)
+    sketch = QuantileSketch([0] * 8 + [1, 2])
+    assert sketch.percentile(0) == pytest.approx(40.0)
+
+
+def test_ties_merged_across_sketches():
+    merged = QuantileSketch([0] * 4 + [1]).merge(QuantileSketch([0] * 4 + [2]))
+    assert list(merged.values) == [0, 1, 2]
+    assert merged.percentile(0) == pytest.approx(40.0)
+
+
+def test_compressed_sketch_keeps_tails():
+    values = np.random.default_rng(0).normal(size=100_000)
+    sketch = QuantileSketch(values, max_size=200)
+    assert len(sketch.values) <= 200
+    for q in (0.1, 1, 50, 99, 99.9):
+        assert sketch.percentile(np.percentile(values, q)) == pytest.approx(q, abs=0.05 + q * 0.002)
+
+
+def test_unparseable_age_goes_to_any_band():
+    assert age_band("unknown") == "*"
+    index = NormativeIndex.from_table([{"age": "unknown", "sex": "F", "hnr_mean": "20"}])
+    assert "F|*" in index.sketches
+
+
+def test_percentiles_report_stratum_used():
+    index = NormativeIndex.from_table(
+        [{"age": "30", "sex": "M", "hnr_mean": str(v)} for v in range(10)]
+        + [{"age": "", "sex": "", "jitter_local": str(v)} for v in range(10)]
+    )
+    result = index.percentiles({"hnr_mean": 4.5, "jitter_local": 4.5}, age=30, sex="M")
+    assert result["requested_stratum"] == "M|<50"
+    assert result["percentiles"]["hnr_mean"]["stratum"] == "M|<50"
+    assert result["percentiles"]["jitter_local"]["stratum"] == "*|*"
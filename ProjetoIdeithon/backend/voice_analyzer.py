@@ -17,6 +17,7 @@ Key biomarkers extracted:
 - Harmonic-to-Noise Ratio (HNR)
 """
 
+import base64
 import numpy as np
 import librosa
 import parselmouth
@@ -28,35 +29,182 @@ import warnings
 warnings.filterwarnings("ignore")
 
 
+# Analysis quality tiers, from full resolution to cheapest.
+# Time steps of 0.0 let Praat pick its default (finest) step.
+# relative_cost is the measured extraction time per analysed second relative to "full".
+ANALYSIS_TIERS = {
+    "full": {
+        "relative_cost": 1.0,
+        "pitch_time_step": 0.0,
+        "intensity_time_step": 0.0,
+        "formant_time_step": 0.0,
+        "formant_window": 0.025,
+        "hnr_time_step": 0.01,
+        "hop_length": 512,
+        "max_duration": None,
+        "skip": (),
+    },
+    "standard": {
+        "relative_cost": 0.8,
+        "pitch_time_step": 0.01,
+        "intensity_time_step": 0.01,
+        "formant_time_step": 0.01,
+        "formant_window": 0.025,
+        "hnr_time_step": 0.02,
+        "hop_length": 512,
+        "max_duration": 120.0,
+        "skip": (),
+    },
+    "fast": {
+        "relative_cost": 0.4,
+        "pitch_time_step": 0.02,
+        "intensity_time_step": 0.02,
+        "formant_time_step": 0.02,
+        "formant_window": 0.03,
+        "hnr_time_step": 0.04,
+        "hop_length": 1024,
+        "max_duration": 45.0,
+        "skip": ("mfcc",),  # MFCCs are not used by CognitiveRiskScorer
+    },
+}
+TIER_ORDER = ["full", "standard", "fast"]
+
+
 class VoiceBiomarkerExtractor:
     """Extracts acoustic biomarkers from voice recordings following
     eGeMAPS standard and Alzheimer's detection research protocols."""
 
-    def __init__(self, sr=16000):
-        self.sr = sr
+    # Voice activity detection used to select what the Praat analyses see
+    VAD_FRAME_LENGTH = 2048
+    VAD_HOP_LENGTH = 512
+    TRIM_PADDING = 0.1      # Seconds of silence kept around the trimmed recording (below the 150 ms pause floor)
+    MAX_LEADING_SILENCE = 15.0  # Extra seconds decoded past the duration cap to find where speech starts
+    REGION_PADDING = 0.05   # Seconds kept around each voiced region
+    MIN_REGION_GAP = 0.3    # Voiced regions closer than this are analysed as one
 
-    def extract_all(self, audio_path: str) -> dict:
-        """Extract all biomarkers from an audio file."""
-        y, sr = librosa.load(audio_path, sr=self.sr)
-        snd = parselmouth.Sound(audio_path)
+    def __init__(self, sr=16000, max_duration: float = None):
+        self.sr = sr
+        self.max_duration = max_duration
+
+    def extract_all(self, audio_path: str, contour_points: int = 0, tier: str = "full") -> dict:
+        """Extract all biomarkers from an audio file.
+        `tier` selects an entry of ANALYSIS_TIERS (time steps, hop size, analysed duration).
+        With contour_points > 0 the per-frame F0, intensity and HNR tracks and the
+        pause timeline are also returned under "contours", downsampled for charts.
+
+        Leading/trailing silence is trimmed and the analysed duration capped first.
+        Pitch, formants and HNR then run only over the concatenated voiced regions.
+        Jitter/shimmer (cycle-to-cycle measures) and the spectral features use the
+        trimmed timeline, so region joins never count as a period or amplitude jump.
+        Pause, duration and speech-rate features use the untrimmed timeline (only cut
+        by the duration cap), matching the whole-recording calibration of
+        CognitiveRiskScorer. What was skipped is reported under "preprocessing"."""
+        q = ANALYSIS_TIERS[tier]
+        max_duration = min(d for d in (q["max_duration"], self.max_duration, np.inf) if d)
+        # Only decode what the duration cap can use (plus room for leading silence)
+        decode_limit = max_duration + self.MAX_LEADING_SILENCE if np.isfinite(max_duration) else None
+        y_full, sr = librosa.load(audio_path, sr=self.sr, duration=decode_limit)
+        snd_full = parselmouth.Sound(audio_path)
+        original_duration = snd_full.get_total_duration()
+
+        trim_start, trim_end, regions, (rms, threshold) = self._select_regions(y_full, sr, max_duration)
+
+        # Fluency timeline: from the start of the recording to the end of the capped window
+        fluency_end = min(len(y_full) / sr, trim_start + max_duration)
+        y_fluency = y_full[:int(fluency_end * sr)]
+        snd_fluency = snd_full
+        if np.isfinite(max_duration) and fluency_end < original_duration:
+            snd_fluency = self._extract_part(snd_full, 0.0, fluency_end)
+        vad = (rms[:1 + len(y_fluency) // self.VAD_HOP_LENGTH], threshold)
+
+        y = y_full[int(trim_start * sr):int(trim_end * sr)]
+        snd = self._extract_part(snd_full, trim_start, trim_end)
+        voiced_snd = snd
+        voiced_duration = trim_end - trim_start
+        if regions:
+            voiced_duration = sum(e - s for s, e in regions)
+            if voiced_duration < 0.95 * (trim_end - trim_start):
+                voiced_snd = parselmouth.Sound.concatenate(
+                    [self._extract_part(snd, s - trim_start, e - trim_start) for s, e in regions]
+                )
+            else:
+                regions = [(trim_start, trim_end)]
+                voiced_duration = trim_end - trim_start
+        frames = {} if contour_points > 0 else None
 
         biomarkers = {}
-        biomarkers.update(self._extract_mfcc(y, sr))
-        biomarkers.update(self._extract_pitch(snd))
+        if "mfcc" not in q["skip"]:
+            biomarkers.update(self._extract_mfcc(y, sr, q))
+        biomarkers.update(self._extract_pitch(voiced_snd, q, frames))
         biomarkers.update(self._extract_jitter_shimmer(snd))
-        biomarkers.update(self._extract_formants(snd))
-        biomarkers.update(self._extract_spectral(y, sr))
-        biomarkers.update(self._extract_energy(y))
-        biomarkers.update(self._extract_speech_rate(snd, y, sr))
-        biomarkers.update(self._extract_hnr(snd))
+        biomarkers.update(self._extract_formants(voiced_snd, q))
+        biomarkers.update(self._extract_spectral(y, sr, q))
+        biomarkers.update(self._extract_energy(y, q))
+        biomarkers.update(self._extract_speech_rate(snd_fluency, y_fluency, sr, q, frames, vad))
+        biomarkers.update(self._extract_hnr(voiced_snd, q, frames))
+
+        biomarkers["preprocessing"] = {
+            "original_duration_sec": round(float(original_duration), 2),
+            "analysed_duration_sec": round(float(trim_end - trim_start), 2),
+            "voiced_duration_sec": round(float(voiced_duration), 2),
+            "voiced_regions": len(regions),
+            "skipped_fraction": round(float(1 - voiced_duration / original_duration), 3) if original_duration > 0 else 0.0,
+        }
+
+        if frames is not None:
+            # Map the voiced-only tracks back onto the original recording's time axis
+            # (intensity and pauses already use it)
+            frames["f0"] = (_voiced_to_original_times(frames["f0"][0], regions, trim_start), frames["f0"][1])
+            frames["hnr"] = (_voiced_to_original_times(frames["hnr"][0], regions, trim_start), frames["hnr"][1])
+            biomarkers["contours"] = build_contours(frames, contour_points)
 
         return biomarkers
 
-    def _extract_mfcc(self, y, sr) -> dict:
+    def _select_regions(self, y, sr, max_duration: float) -> tuple:
+        """Trim bounds and voiced regions (in seconds) from an RMS energy gate.
+        Also returns the RMS frames of the whole decoded signal and the gate
+        threshold, which the pause analysis reuses instead of recomputing them."""
+        hop = self.VAD_HOP_LENGTH
+        duration = len(y) / sr
+        rms = librosa.feature.rms(y=y, frame_length=self.VAD_FRAME_LENGTH, hop_length=hop)[0]
+        threshold = np.mean(rms) * 0.3
+        is_voiced = rms > threshold
+        max_frames = int(max_duration * sr / hop) if np.isfinite(max_duration) else len(rms)
+        if not np.any(is_voiced):
+            return 0.0, min(duration, max_frames * hop / sr), [], (rms, threshold)
+
+        # Voiced runs as [start, end) frame indices; trim bounds stay on frame boundaries
+        edges = np.diff(np.concatenate([[0], is_voiced.astype(np.int8), [0]]))
+        start_frames = np.flatnonzero(edges == 1)
+        end_frames = np.flatnonzero(edges == -1)
+        pad = int(round(self.TRIM_PADDING * sr / hop))
+        first = max(0, start_frames[0] - pad)
+        last = min(len(rms), end_frames[-1] + pad, first + max_frames)
+
+        trim_start = first * hop / sr
+        trim_end = min(duration, last * hop / sr)
+        starts, ends = start_frames * hop / sr, end_frames * hop / sr
+
+        regions = []
+        for s, e in zip(starts, ends):
+            s, e = max(trim_start, s - self.REGION_PADDING), min(trim_end, e + self.REGION_PADDING)
+            if e <= s:
+                continue
+            if regions and s - regions[-1][1] < self.MIN_REGION_GAP:
+                regions[-1] = (regions[-1][0], e)
+            else:
+                regions.append((s, e))
+        return trim_start, trim_end, regions, (rms, threshold)
+
+    @staticmethod
+    def _extract_part(snd, start: float, end: float):
+        return snd.extract_part(start, end, parselmouth.WindowShape.RECTANGULAR, 1.0, False)
+
+    def _extract_mfcc(self, y, sr, q: dict = ANALYSIS_TIERS["full"]) -> dict:
         """MFCC - Mel-Frequency Cepstral Coefficients
         Key feature in Alzheimer's detection (eGeMAPS standard).
         Changes in MFCC reflect vocal tract shape changes associated with cognitive decline."""
-        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
+        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13, hop_length=q["hop_length"])
         result = {}
         for i in range(13):
             result[f"mfcc_{i+1}_mean"] = float(np.mean(mfccs[i]))
@@ -66,16 +214,21 @@ class VoiceBiomarkerExtractor:
             result[f"delta_mfcc_{i+1}_mean"] = float(np.mean(delta_mfcc[i]))
         return result
 
-    def _extract_pitch(self, snd) -> dict:
+    def _extract_pitch(self, snd, q: dict = ANALYSIS_TIERS["full"], frames: dict = None) -> dict:
         """F0 - Fundamental Frequency
         Alzheimer's patients show reduced F0 variability and monotone speech.
         Reference: Frontiers in Psychology, 2021."""
-        pitch = call(snd, "To Pitch", 0.0, 75, 600)
+        pitch = call(snd, "To Pitch", q["pitch_time_step"], 75, 600)
         f0_values = []
+        f0_track = []
         for i in range(call(pitch, "Get number of frames")):
             f0 = call(pitch, "Get value in frame", i + 1, "Hertz")
             if not np.isnan(f0):
                 f0_values.append(f0)
+            f0_track.append(0.0 if np.isnan(f0) else f0)
+
+        if frames is not None:
+            frames["f0"] = (pitch.xs(), np.asarray(f0_track))
 
         if len(f0_values) == 0:
             f0_values = [0.0]
@@ -95,7 +248,6 @@ class VoiceBiomarkerExtractor:
         Shimmer: cycle-to-cycle variation in amplitude
         Both increase in Alzheimer's patients.
         Reference: Alzheimer's Research & Therapy, 2022."""
-        pitch = call(snd, "To Pitch", 0.0, 75, 600)
         point_process = call(snd, "To PointProcess (periodic, cc)", 75, 600)
 
         jitter_local = call(point_process, "Get jitter (local)", 0, 0, 0.0001, 0.02, 1.3)
@@ -115,12 +267,12 @@ class VoiceBiomarkerExtractor:
             "shimmer_apq5": float(shimmer_apq5) if not np.isnan(shimmer_apq5) else 0.0,
         }
 
-    def _extract_formants(self, snd) -> dict:
+    def _extract_formants(self, snd, q: dict = ANALYSIS_TIERS["full"]) -> dict:
         """Formants F1, F2, F3
         Formant frequencies reflect articulatory precision.
         Alzheimer's patients show less distinct formant patterns.
         Reference: Speech based detection of AD survey, 2024."""
-        formant = call(snd, "To Formant (burg)", 0.0, 5, 5500, 0.025, 50)
+        formant = call(snd, "To Formant (burg)", q["formant_time_step"], 5, 5500, q["formant_window"], 50)
         n_frames = call(formant, "Get number of frames")
 
         f1_vals, f2_vals, f3_vals = [], [], []
@@ -142,16 +294,17 @@ class VoiceBiomarkerExtractor:
             "f3_std": float(np.std(f3_vals)) if f3_vals else 0.0,
         }
 
-    def _extract_spectral(self, y, sr) -> dict:
+    def _extract_spectral(self, y, sr, q: dict = ANALYSIS_TIERS["full"]) -> dict:
         """Spectral features - eGeMAPS standard
         Spectral centroid, bandwidth, rolloff, flux.
         Changes indicate vocal quality degradation.
         Reference: eGeMAPS feature set (Eyben et al.)."""
-        spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-        spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)[0]
-        spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
-        spectral_flux = librosa.onset.onset_strength(y=y, sr=sr)
-        zcr = librosa.feature.zero_crossing_rate(y)[0]
+        hop = q["hop_length"]
+        spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr, hop_length=hop)[0]
+        spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr, hop_length=hop)[0]
+        spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr, hop_length=hop)[0]
+        spectral_flux = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop)
+        zcr = librosa.feature.zero_crossing_rate(y, hop_length=hop)[0]
 
         return {
             "spectral_centroid_mean": float(np.mean(spectral_centroid)),
@@ -164,11 +317,11 @@ class VoiceBiomarkerExtractor:
             "zcr_std": float(np.std(zcr)),
         }
 
-    def _extract_energy(self, y) -> dict:
+    def _extract_energy(self, y, q: dict = ANALYSIS_TIERS["full"]) -> dict:
         """Energy / Loudness features
         RMS energy and its variation.
         Alzheimer's patients show reduced loudness variability."""
-        rms = librosa.feature.rms(y=y)[0]
+        rms = librosa.feature.rms(y=y, hop_length=q["hop_length"])[0]
         return {
             "energy_mean": float(np.mean(rms)),
             "energy_std": float(np.std(rms)),
@@ -177,19 +330,23 @@ class VoiceBiomarkerExtractor:
             "energy_range": float(np.max(rms) - np.min(rms)),
         }
 
-    def _extract_speech_rate(self, snd, y, sr) -> dict:
+    def _extract_speech_rate(self, snd, y, sr, q: dict = ANALYSIS_TIERS["full"], frames: dict = None,
+                             vad: tuple = None) -> dict:
         """Speech rate & pause analysis
         Key Alzheimer's biomarker: increased pause duration, reduced speech rate,
         more hesitations, longer silence-to-speech ratio.
         Reference: Frontiers in Computer Science, 2021 (OVBM)."""
-        intensity = call(snd, "To Intensity", 75, 0.0)
+        intensity = call(snd, "To Intensity", 75, q["intensity_time_step"])
         duration = snd.get_total_duration()
 
-        # Detect voiced/unvoiced segments
+        # Detect voiced/unvoiced segments (reusing the preprocessing gate when given)
         frame_length = 2048
         hop_length = 512
-        rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
-        threshold = np.mean(rms) * 0.3
+        if vad is not None:
+            rms, threshold = vad
+        else:
+            rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
+            threshold = np.mean(rms) * 0.3
 
         voiced_frames = np.sum(rms > threshold)
         total_frames = len(rms)
@@ -203,6 +360,7 @@ class VoiceBiomarkerExtractor:
         is_voiced = rms > threshold
         pause_count = 0
         pause_durations = []
+        pause_segments = []
         in_pause = False
         pause_start = 0
 
@@ -216,6 +374,11 @@ class VoiceBiomarkerExtractor:
                 if pause_dur > 0.15:  # Only count pauses > 150ms
                     pause_count += 1
                     pause_durations.append(pause_dur)
+                    pause_segments.append((pause_start * hop_length / sr, i * hop_length / sr))
+
+        if frames is not None:
+            frames["intensity"] = (intensity.xs(), intensity.values[0])
+            frames["pauses"] = pause_segments
 
         avg_pause_duration = float(np.mean(pause_durations)) if pause_durations else 0.0
         max_pause_duration = float(np.max(pause_durations)) if pause_durations else 0.0
@@ -230,17 +393,24 @@ class VoiceBiomarkerExtractor:
             "estimated_speech_rate": float(voiced_frames / duration) if duration > 0 else 0.0,
         }
 
-    def _extract_hnr(self, snd) -> dict:
+    def _extract_hnr(self, snd, q: dict = ANALYSIS_TIERS["full"], frames: dict = None) -> dict:
         """Harmonic-to-Noise Ratio (HNR)
         Measures voice quality/breathiness.
         Lower HNR in Alzheimer's patients indicates breathier voice.
         Reference: MDPI Applied Sciences, 2023."""
-        harmonicity = call(snd, "To Harmonicity (cc)", 0.01, 75, 0.1, 1.0)
+        harmonicity = call(snd, "To Harmonicity (cc)", q["hnr_time_step"], 75, 0.1, 1.0)
         hnr_values = []
+        hnr_track = []
         for i in range(call(harmonicity, "Get number of frames")):
             val = call(harmonicity, "Get value in frame", i + 1)
             if not np.isnan(val) and val != -200:
                 hnr_values.append(val)
+                hnr_track.append(val)
+            else:
+                hnr_track.append(0.0)
+
+        if frames is not None:
+            frames["hnr"] = (harmonicity.xs(), np.asarray(hnr_track))
 
         return {
             "hnr_mean": float(np.mean(hnr_values)) if hnr_values else 0.0,
@@ -250,6 +420,72 @@ class VoiceBiomarkerExtractor:
         }
 
 
+def lttb_downsample(x, y, n_out: int):
+    """Largest-Triangle-Three-Buckets downsampling (Steinarsson, 2013).
+    Keeps the points that best preserve the visual shape of a line chart,
+    so peaks and dips survive decimation. Returns (x, y) with at most n_out points."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    # Interior points 1..n-2 split into n_out-2 buckets; first and last points are always kept
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    edges = np.append(edges, n)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        # Average of the next bucket is the third triangle vertex
+        nxt_start, nxt_end = end, max(edges[i + 2], end + 1)
+        cx, cy = x[nxt_start:nxt_end].mean(), y[nxt_start:nxt_end].mean()
+
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+
+    return x[keep], y[keep]
+
+
+def _voiced_to_original_times(times, regions: list, trim_start: float):
+    """Map times on the concatenated voiced-region sound back to the original recording."""
+    times = np.asarray(times, dtype=np.float64)
+    if not regions:
+        return times + trim_start
+    starts = np.array([s for s, _ in regions])
+    lengths = np.array([e - s for s, e in regions])
+    offsets = np.concatenate([[0.0], np.cumsum(lengths)[:-1]])
+    idx = np.clip(np.searchsorted(offsets, times, side="right") - 1, 0, len(regions) - 1)
+    return starts[idx] + (times - offsets[idx])
+
+
+def pack_float32(values) -> str:
+    """Little-endian float32 array as base64 (4 bytes per value)."""
+    return base64.b64encode(np.asarray(values, dtype="<f4").tobytes()).decode("ascii")
+
+
+def build_contours(frames: dict, n_points: int) -> dict:
+    """Downsample the per-frame tracks collected during extraction into a
+    compact chart payload. Unvoiced frames are reported as 0."""
+    contours = {"encoding": "float32-le-base64", "tracks": {}}
+    for name, unit in (("f0", "Hz"), ("intensity", "dB"), ("hnr", "dB")):
+        if name not in frames:
+            continue
+        t, v = lttb_downsample(*frames[name], n_points)
+        contours["tracks"][name] = {
+            "unit": unit,
+            "points": int(len(t)),
+            "times": pack_float32(t),
+            "values": pack_float32(v),
+        }
+    pauses = np.asarray(frames.get("pauses", []), dtype=np.float64).reshape(-1, 2)
+    contours["pauses"] = {"count": int(len(pauses)), "segments": pack_float32(pauses.ravel())}
+    return contours
+
+
 class CognitiveRiskScorer:
     """Scores cognitive decline risk based on voice biomarkers.
     Uses thresholds derived from published research on AD speech patterns.